@@ -0,0 +1,265 @@
+"""
+Benchmark the API endpoints against the offline Google emulator.
+
+Records wall time, Google API call count, response bytes received from the
+APIs and peak Python memory for each endpoint, using synthetic fixtures of
+configurable size.
+
+Example: python benchmark.py --students 2000 --coursework 10 --latency 0.02
+
+--check-masks runs every endpoint with and without partial responses and
+fails if an endpoint errors or the responses or resulting spreadsheets differ.
+
+--encode N compares building and encoding N submission records as dicts with
+jsonify against msgspec records with the msgspec encoder.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='classroom-bench-'))
+
+from google.oauth2.credentials import Credentials
+
+import app as classroom_app
+from google_emulator import Fixtures, GoogleEmulator
+
+COURSE_ID = '100000'
+ASSIGNMENT_ID = '300000'
+USER_IDS = ','.join(str(200000000 + index) for index in range(0, 40, 3))
+
+# (name, method, url); each run gets fresh fixtures since the write endpoints modify them
+SCENARIOS = [
+    ('courses', 'GET', '/courses'),
+    ('assignments', 'GET', f'/assignments?course_id={COURSE_ID}'),
+    ('students', 'GET', f'/students?course_id={COURSE_ID}'),
+    ('submissions', 'GET', f'/submissions?course_id={COURSE_ID}&assignment_id={ASSIGNMENT_ID}'),
+    ('update-grades', 'POST',
+     f'/update-grades?course_id={COURSE_ID}&assignment_id={ASSIGNMENT_ID}&spreadsheet_id=bench-sheet'),
+    ('update-grades (user_ids)', 'POST',
+     f'/update-grades?course_id={COURSE_ID}&assignment_id={ASSIGNMENT_ID}&spreadsheet_id=bench-sheet'
+     f'&user_ids={USER_IDS}'),
+    ('sync-grades', 'POST', f'/sync-grades?course_id={COURSE_ID}&spreadsheet_id=bench-sheet'),
+    ('push_attendance', 'POST', '/push_attendance?spreadsheet_id=bench-sheet&sheet_name=Attendance 1'),
+    ('push_attendance (all)', 'POST', '/push_attendance?spreadsheet_id=bench-sheet&sheet_pattern=Attendance*'),
+    ('push_students_to_sheet', 'POST', f'/push_students_to_sheet?course_id={COURSE_ID}&spreadsheet_id=bench-empty'),
+    ('leaderboard', 'GET', '/leaderboard?spreadsheet_id=bench-sheet&top=10&tier=Senior'),
+    ('manage-courses', 'GET', '/manage-courses'),
+    ('manage-students', 'GET', f'/manage-students/{COURSE_ID}'),
+    ('manage-assignments', 'GET', f'/manage-assignments/{COURSE_ID}'),
+]
+
+
+def reset_caches():
+    """Start every run cold, so repeated runs measure the same work."""
+    classroom_app.roster_cache.invalidate()
+    classroom_app.leaderboards.invalidate()
+    classroom_app.response_cache.invalidate()
+    classroom_app.fragment_cache.invalidate()
+    classroom_app.sync_watermarks.clear()
+    classroom_app.shared_cache.invalidate()
+
+
+def make_client():
+    """Return a test client whose session is authenticated with dummy credentials."""
+    client = classroom_app.app.test_client()
+    key = 'benchmark'
+    classroom_app.credential_store.put(key, Credentials(token='emulator'))
+    with client.session_transaction() as session:
+        session['credential_key'] = key
+    return client
+
+
+def run_once(args, method, url, trace_memory, partial_responses=True):
+    emulator = GoogleEmulator(
+        Fixtures.generate(
+            students=args.students,
+            coursework=args.coursework,
+            attendance_sheets=args.attendance_sheets,
+            sheet_columns=args.sheet_columns,
+        ),
+        latency=args.latency,
+    )
+    classroom_app.app.config['GOOGLE_SERVICE_BUILDER'] = emulator.build
+    classroom_app.app.config['GOOGLE_PARTIAL_RESPONSES'] = partial_responses
+    reset_caches()
+    client = make_client()
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    response = client.open(url, method=method)
+    response.get_data()  # Drain streamed responses
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        'status': response.status_code,
+        'seconds': elapsed,
+        'api_calls': emulator.call_count,
+        'calls_by_method': dict(emulator.calls),
+        'api_bytes': sum(emulator.bytes.values()),
+        'peak_bytes': peak,
+        'body': response.get_data(as_text=True),
+        'spreadsheets': emulator.fixtures.spreadsheets,
+    }
+
+
+def run(args):
+    results = {}
+    for name, method, url in SCENARIOS:
+        if args.only and name not in args.only:
+            continue
+        if args.format and method == 'GET':
+            url += f"{'&' if '?' in url else '?'}format={args.format}"
+        timings = [run_once(args, method, url, trace_memory=False) for _ in range(args.repeat)]
+        # Memory is measured on a separate run, tracemalloc slows everything down
+        memory = run_once(args, method, url, trace_memory=True)
+        results[name] = {
+            'status': timings[0]['status'],
+            'median_seconds': statistics.median(run['seconds'] for run in timings),
+            'api_calls': timings[0]['api_calls'],
+            'calls_by_method': timings[0]['calls_by_method'],
+            'api_kib': timings[0]['api_bytes'] / 1024,
+            'peak_mib': memory['peak_bytes'] / (1024 * 1024),
+        }
+    return results
+
+
+def comparable_body(body):
+    """Parse a response body, dropping the call counters that page sizes legitimately change."""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        try:
+            # Streamed NDJSON
+            return [json.loads(line) for line in body.splitlines()]
+        except ValueError:
+            # HTML pages
+            return body
+    if isinstance(data, dict):
+        data.pop('api_calls', None)
+    return data
+
+
+def check_masks(args):
+    """Return the names of the scenarios that fail or whose output changes with partial responses."""
+    mismatches = []
+    for name, method, url in SCENARIOS:
+        if args.only and name not in args.only:
+            continue
+        if args.format and method == 'GET':
+            url += f"{'&' if '?' in url else '?'}format={args.format}"
+        full = run_once(args, method, url, trace_memory=False, partial_responses=False)
+        partial = run_once(args, method, url, trace_memory=False, partial_responses=True)
+        same = (
+            full['status'] == partial['status']
+            and comparable_body(full['body']) == comparable_body(partial['body'])
+            and full['spreadsheets'] == partial['spreadsheets']
+        )
+        # An endpoint failing the same way with and without masks isn't a pass either
+        failed = max(full['status'], partial['status']) >= 400
+        outcome = 'FAILED' if failed else 'ok' if same else 'DIFFERENT'
+        print(f"{name:<24}{outcome:>10}"
+              f"{full['api_calls']:>8} -> {partial['api_calls']:<6} calls"
+              f"{full['api_bytes'] / 1024:>10.1f} -> {partial['api_bytes'] / 1024:.1f} KiB")
+        if failed or not same:
+            mismatches.append(name)
+    return mismatches
+
+
+def build_submission_records(count, as_structs):
+    """Synthetic /submissions records, as dicts or as msgspec structs."""
+    records = []
+    for index in range(count):
+        attachments = [
+            ('link', f'Link {n}', f'https://example.com/{index}/{n}') for n in range(2)
+        ]
+        if as_structs:
+            records.append(classroom_app.SubmissionRecord(
+                id=f'sub-{index}', userId=str(200000000 + index), name=f'Student {index}',
+                email=f'student{index}@example.com', state='TURNED_IN', assignedGrade=None,
+                attachments=[classroom_app.Attachment(*attachment) for attachment in attachments],
+            ))
+        else:
+            records.append({
+                'id': f'sub-{index}', 'userId': str(200000000 + index), 'name': f'Student {index}',
+                'email': f'student{index}@example.com', 'state': 'TURNED_IN', 'assignedGrade': None,
+                'attachments': [dict(zip(('type', 'title', 'link'), attachment)) for attachment in attachments],
+            })
+    return records
+
+
+def encode_benchmark(count, repeat):
+    """Time and measure jsonify on dicts against json_response on msgspec records."""
+    paths = {
+        'dict + jsonify': (False, classroom_app.jsonify),
+        'msgspec': (True, classroom_app.json_response),
+    }
+    results = {}
+    with classroom_app.app.app_context():
+        for name, (as_structs, encode) in paths.items():
+            tracemalloc.start()
+            records = build_submission_records(count, as_structs)
+            records_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                body = encode(records).get_data()
+                timings.append(time.perf_counter() - start)
+            results[name] = {
+                'encode_seconds': statistics.median(timings),
+                'records_mib': records_bytes / (1024 * 1024),
+                'body_bytes': len(body),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=400)
+    parser.add_argument('--coursework', type=int, default=10)
+    parser.add_argument('--attendance-sheets', type=int, default=3)
+    parser.add_argument('--sheet-columns', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02, help='Simulated seconds per API call')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--format', choices=['ndjson', 'stream'], help='Stream the GET endpoints')
+    parser.add_argument('--only', nargs='*', help='Scenario names to run')
+    parser.add_argument('--json', help='Also write the results to this file')
+    parser.add_argument('--check-masks', action='store_true',
+                        help='Compare the output with and without partial responses')
+    parser.add_argument('--encode', type=int, metavar='N',
+                        help='Compare JSON encoding paths on N submission records')
+    args = parser.parse_args()
+
+    if args.encode:
+        print(f"{'path':<24}{'encode s':>10}{'records MiB':>13}{'body KiB':>10}")
+        for name, result in encode_benchmark(args.encode, args.repeat).items():
+            print(f"{name:<24}{result['encode_seconds']:>10.4f}{result['records_mib']:>13.1f}"
+                  f"{result['body_bytes'] / 1024:>10.1f}")
+        return
+
+    if args.check_masks:
+        raise SystemExit(1 if check_masks(args) else 0)
+
+    results = run(args)
+
+    print(f"{'endpoint':<24}{'status':>8}{'seconds':>10}{'api calls':>11}{'api KiB':>10}{'peak MiB':>10}")
+    for name, result in results.items():
+        print(f"{name:<24}{result['status']:>8}{result['median_seconds']:>10.3f}"
+              f"{result['api_calls']:>11}{result['api_kib']:>10.1f}{result['peak_mib']:>10.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
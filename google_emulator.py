@@ -0,0 +1,486 @@
+"""
+Offline stand-in for the Google Classroom and Sheets APIs used by app.py.
+
+It serves synthetic fixtures through the same resource/method/execute() chain as
+the service objects returned by googleapiclient, with a simulated latency per
+call, and counts every call it receives. Inject it in place of build():
+
+    emulator = GoogleEmulator(Fixtures.generate(students=10000), latency=0.05)
+    app.config['GOOGLE_SERVICE_BUILDER'] = emulator.build
+
+Only the methods and parameters app.py uses are implemented.
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+# Classroom returns 30 items per page when no pageSize is given
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 1000
+
+FIRST_NAMES = ['Ana', 'Ben', 'Carla', 'Dan', 'Eli', 'Faye', 'Gio', 'Hana', 'Ivan', 'Jo', 'Kai', 'Lea']
+LAST_NAMES = ['Reyes', 'Santos', 'Cruz', 'Garcia', 'Mendoza', 'Torres', 'Flores', 'Ramos', 'Bautista']
+SUBMISSION_STATES = ['NEW', 'CREATED', 'TURNED_IN', 'RETURNED', 'RECLAIMED_BY_STUDENT']
+
+
+######################## Fixtures ########################
+class Fixtures:
+    """Synthetic courses, rosters, coursework, submissions and spreadsheets."""
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.attachments = 2  # Attachments per submission
+        self.courses = []
+        self.students = {}  # course id -> student resources
+        self.coursework = {}  # course id -> coursework resources
+        self.spreadsheets = {}  # spreadsheet id -> {sheet name: rows}
+        self._submissions = {}  # (course id, coursework id) -> submission resources
+        self._lock = threading.Lock()
+
+    @classmethod
+    def generate(cls, courses=1, students=400, coursework=10, attachments=2,
+                 attendance_sheets=3, sheet_columns=20, seed=0):
+        """
+        Build a fixture set. The first course gets `students` students and
+        `coursework` assignments. Spreadsheet 'bench-sheet' has a Sheet1 with one
+        row per student of the first course padded to `sheet_columns` columns, plus
+        `attendance_sheets` attendance sheets. Spreadsheet 'bench-empty' is empty.
+        """
+        fixtures = cls(seed)
+        fixtures.attachments = attachments
+        rng = fixtures.random
+
+        for course_index in range(courses):
+            course_id = str(100000 + course_index)
+            fixtures.courses.append({
+                'id': course_id,
+                'name': 'GDG `25 Web Development' if course_index == 0 else f'Course {course_index}',
+                'section': f'Section {course_index}',
+                'room': f'Room {course_index}',
+                'courseState': 'ACTIVE',
+                'alternateLink': f'https://classroom.google.com/c/{course_id}',
+            })
+
+            course_students = []
+            for student_index in range(students if course_index == 0 else min(students, 30)):
+                user_id = str(200000000 + course_index * 1000000 + student_index)
+                name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {student_index}'
+                course_students.append({
+                    'courseId': course_id,
+                    'userId': user_id,
+                    'profile': {
+                        'id': user_id,
+                        'name': {
+                            'givenName': name.split()[0],
+                            'familyName': name.split()[1],
+                            'fullName': name,
+                        },
+                        'emailAddress': f'student{course_index}.{student_index}@example.com',
+                        'photoUrl': f'https://lh3.googleusercontent.com/a/{user_id}',
+                        'permissions': [{'permission': 'CREATE_COURSE'}],
+                    },
+                })
+            fixtures.students[course_id] = course_students
+
+            fixtures.coursework[course_id] = [
+                {
+                    'courseId': course_id,
+                    'id': str(300000 + course_index * 1000 + work_index),
+                    'title': f'Activity {work_index + 1}: Build a page',
+                    'description': 'Synthetic assignment ' * 10,
+                    'state': 'PUBLISHED',
+                    'alternateLink': f'https://classroom.google.com/c/{course_id}/a/{work_index}',
+                    'creationTime': '2025-01-%02dT08:00:00.000Z' % (work_index % 28 + 1),
+                    'updateTime': '2025-01-%02dT08:00:00.000Z' % (work_index % 28 + 1),
+                    'dueDate': {'year': 2025, 'month': 2, 'day': work_index % 28 + 1},
+                    'maxPoints': 100,
+                    'workType': 'ASSIGNMENT',
+                }
+                for work_index in range(coursework if course_index == 0 else 2)
+            ]
+
+        first_course = fixtures.courses[0]['id'] if fixtures.courses else None
+        roster = fixtures.students.get(first_course, [])
+        header = ['google_classroom_Id', 'name', 'email', 'points', 'rank']
+        header += [f'extra_{index}' for index in range(len(header), sheet_columns)]
+        sheet1 = [header]
+        for student in roster:
+            row = [student['userId'], student['profile']['name']['fullName'],
+                   student['profile']['emailAddress'], str(rng.randint(0, 300)), 'Cadet']
+            row += ['x'] * (sheet_columns - len(row))
+            sheet1.append(row)
+
+        sheets = {'Sheet1': sheet1}
+        for sheet_index in range(attendance_sheets):
+            attendees = [student for student in roster if rng.random() < 0.8]
+            sheets[f'Attendance {sheet_index + 1}'] = [['Timestamp', 'Email', 'Name']] + [
+                ['2025-01-01 08:00', student['profile']['emailAddress'].upper(),
+                 student['profile']['name']['fullName']]
+                for student in attendees
+            ]
+        fixtures.spreadsheets['bench-sheet'] = sheets
+        fixtures.spreadsheets['bench-empty'] = {'Sheet1': []}
+        return fixtures
+
+    def submissions(self, course_id, coursework_id):
+        """Submissions of a coursework, generated on first use."""
+        key = (course_id, coursework_id)
+        with self._lock:
+            if key not in self._submissions:
+                self._submissions[key] = self._generate_submissions(course_id, coursework_id)
+            return self._submissions[key]
+
+    def _generate_submissions(self, course_id, coursework_id):
+        rng = random.Random(f'{course_id}/{coursework_id}')
+        submissions = []
+        for index, student in enumerate(self.students.get(course_id, [])):
+            state = rng.choice(SUBMISSION_STATES)
+            submission = {
+                'courseId': course_id,
+                'courseWorkId': coursework_id,
+                'id': f'sub-{coursework_id}-{index}',
+                'userId': student['userId'],
+                'creationTime': '2025-01-01T08:00:00.000Z',
+                'updateTime': '2025-01-%02dT%02d:00:00.000Z' % (rng.randint(1, 28), rng.randint(0, 23)),
+                'state': state,
+                'alternateLink': f'https://classroom.google.com/c/{course_id}/a/{coursework_id}/submissions/{index}',
+                'courseWorkType': 'ASSIGNMENT',
+                'assignmentSubmission': {
+                    'attachments': [
+                        {'link': {'url': f'https://example.com/{index}/{n}', 'title': f'Link {n}'}}
+                        if n % 2 else
+                        {'driveFile': {'id': f'file-{index}-{n}', 'title': f'File {n}',
+                                       'alternateLink': f'https://drive.google.com/file/d/{index}-{n}'}}
+                        for n in range(self.attachments)
+                    ]
+                },
+                'submissionHistory': [{'stateHistory': {'state': 'CREATED'}}],
+            }
+            if state == 'RETURNED':
+                submission['assignedGrade'] = rng.choice([50, 80, 100])
+            submissions.append(submission)
+        return submissions
+
+
+######################## A1 notation ########################
+RANGE_PATTERN = re.compile(r"^(?:'((?:[^']|'')+)'|([^!]+))(?:!([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?)?$")
+
+
+def column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def parse_range(a1_range):
+    """Split an A1 range into (sheet, start_row, start_col, end_row, end_col), 0-based and inclusive."""
+    match = RANGE_PATTERN.match(a1_range)
+    if not match:
+        raise ValueError(f'Unable to parse range: {a1_range}')
+    quoted, plain, start_col, start_row, end_col, end_row = match.groups()
+    sheet = quoted.replace("''", "'") if quoted else plain
+    return (
+        sheet,
+        int(start_row) - 1 if start_row else 0,
+        column_index(start_col) if start_col else 0,
+        int(end_row) - 1 if end_row else None,
+        column_index(end_col) if end_col else None,
+    )
+
+
+######################## Partial responses ########################
+def parse_field_mask(fields):
+    """
+    Parse a partial response mask like 'nextPageToken,students(userId,profile/name)'
+    into a nested dict, where None selects the whole value.
+    """
+    tree, position = _parse_fields(fields, 0)
+    if position != len(fields):
+        raise ValueError(f'Invalid field mask: {fields}')
+    return tree
+
+
+def _parse_fields(fields, position):
+    tree = {}
+    while position < len(fields):
+        match = re.compile(r'[A-Za-z0-9_/]+').match(fields, position)
+        if not match:
+            raise ValueError(f'Invalid field mask: {fields}')
+        path = match.group().split('/')
+        position = match.end()
+        subtree = None
+        if position < len(fields) and fields[position] == '(':
+            subtree, position = _parse_fields(fields, position + 1)
+            if position >= len(fields) or fields[position] != ')':
+                raise ValueError(f'Invalid field mask: {fields}')
+            position += 1
+        # a/b(c) is a(b(c))
+        for name in reversed(path[1:]):
+            subtree = {name: subtree}
+        node = tree.setdefault(path[0], {})
+        if subtree is None or node is None:
+            tree[path[0]] = None
+        else:
+            node.update(subtree)
+        if position < len(fields) and fields[position] == ',':
+            position += 1
+        elif position < len(fields) and fields[position] == ')':
+            break
+    return tree, position
+
+
+def apply_field_mask(value, tree):
+    """Keep only the fields selected by a parsed mask, the way Google filters responses."""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [apply_field_mask(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {name: apply_field_mask(value[name], subtree) for name, subtree in tree.items() if name in value}
+    return value
+
+
+######################## Requests and resources ########################
+class HttpError(Exception):
+    """Raised by emulated calls for unknown resources, mirroring googleapiclient's HttpError."""
+
+    def __init__(self, status, message):
+        super().__init__(f'<HttpError {status}: {message}>')
+        self.status = status
+
+
+class EmulatedRequest:
+    """Counterpart of googleapiclient.http.HttpRequest."""
+
+    def __init__(self, emulator, method_id, handler, params):
+        self.emulator = emulator
+        self.methodId = method_id
+        self.handler = handler
+        self.params = params
+        self.uri = f'emulator://{method_id}'
+
+    def respond(self):
+        """Run the handler, applying the fields parameter like the real APIs do."""
+        params = dict(self.params)
+        fields = params.pop('fields', None)
+        response = self.handler(**params)
+        if fields:
+            response = apply_field_mask(response, parse_field_mask(fields))
+        self.emulator.record_bytes(self.methodId, response)
+        return response
+
+    def execute(self, http=None, num_retries=0):
+        self.emulator.record_call(self.methodId)
+        return self.respond()
+
+
+class EmulatedBatch:
+    """Counterpart of googleapiclient.http.BatchHttpRequest, one round trip per execute()."""
+
+    def __init__(self, emulator, callback=None):
+        self.emulator = emulator
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id or str(len(self.requests) + 1), request, callback))
+
+    def execute(self, http=None):
+        self.emulator.record_call('batch')
+        for request_id, request, callback in self.requests:
+            response, exception = None, None
+            try:
+                response = request.respond()
+            except Exception as e:
+                exception = e
+            (callback or self.callback)(request_id, response, exception)
+
+
+class EmulatedResource:
+    """Resolves attribute chains like courses().courseWork().list to emulated methods."""
+
+    def __init__(self, emulator, path):
+        self._emulator = emulator
+        self._path = path
+
+    def __getattr__(self, name):
+        method_id = f'{self._path}.{name}'
+        handler = self._emulator.handlers.get(method_id)
+        if handler is not None:
+            return lambda **params: EmulatedRequest(self._emulator, method_id, handler, params)
+        return lambda: EmulatedResource(self._emulator, method_id)
+
+    def new_batch_http_request(self, callback=None):
+        return EmulatedBatch(self._emulator, callback)
+
+
+######################## Emulator ########################
+class GoogleEmulator:
+    """Serves a Fixtures set through emulated Classroom v1 and Sheets v4 services."""
+
+    def __init__(self, fixtures, latency=0.0):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.calls = Counter()
+        self.bytes = Counter()  # method id -> JSON response bytes
+        self._lock = threading.Lock()
+        self.handlers = {
+            'classroom.courses.list': self.courses_list,
+            'classroom.courses.get': self.courses_get,
+            'classroom.courses.students.list': self.students_list,
+            'classroom.courses.courseWork.list': self.coursework_list,
+            'classroom.courses.courseWork.get': self.coursework_get,
+            'classroom.courses.courseWork.studentSubmissions.list': self.submissions_list,
+            'sheets.spreadsheets.get': self.spreadsheets_get,
+            'sheets.spreadsheets.values.get': self.values_get,
+            'sheets.spreadsheets.values.batchGet': self.values_batch_get,
+            'sheets.spreadsheets.values.update': self.values_update,
+            'sheets.spreadsheets.values.append': self.values_append,
+            'sheets.spreadsheets.values.batchUpdate': self.values_batch_update,
+        }
+
+    def build(self, api_name, api_version, credentials=None):
+        """Drop-in for build() / app.build_service()."""
+        return EmulatedResource(self, api_name)
+
+    def record_call(self, method_id):
+        with self._lock:
+            self.calls[method_id] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def record_bytes(self, method_id, response):
+        size = len(json.dumps(response))
+        with self._lock:
+            self.bytes[method_id] += size
+
+    @property
+    def call_count(self):
+        return sum(self.calls.values())
+
+    # Classroom
+    def _page(self, items, key, pageToken=None, pageSize=None):
+        size = min(pageSize or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        start = int(pageToken or 0)
+        response = {key: items[start:start + size]} if items[start:start + size] else {}
+        if start + size < len(items):
+            response['nextPageToken'] = str(start + size)
+        return response
+
+    def _course(self, course_id):
+        for course in self.fixtures.courses:
+            if course['id'] == course_id:
+                return course
+        raise HttpError(404, f'Requested entity was not found: course {course_id}')
+
+    def courses_list(self, pageToken=None, pageSize=None, **params):
+        return self._page(self.fixtures.courses, 'courses', pageToken, pageSize)
+
+    def courses_get(self, id, **params):
+        return self._course(id)
+
+    def students_list(self, courseId, pageToken=None, pageSize=None, **params):
+        self._course(courseId)
+        return self._page(self.fixtures.students.get(courseId, []), 'students', pageToken, pageSize)
+
+    def coursework_list(self, courseId, pageToken=None, pageSize=None, **params):
+        self._course(courseId)
+        return self._page(self.fixtures.coursework.get(courseId, []), 'courseWork', pageToken, pageSize)
+
+    def coursework_get(self, courseId, id, **params):
+        for work in self.fixtures.coursework.get(courseId, []):
+            if work['id'] == id:
+                return work
+        raise HttpError(404, f'Requested entity was not found: courseWork {id}')
+
+    def submissions_list(self, courseId, courseWorkId, userId=None, pageToken=None, pageSize=None, **params):
+        self.coursework_get(courseId, courseWorkId)
+        submissions = self.fixtures.submissions(courseId, courseWorkId)
+        if userId is not None:
+            submissions = [submission for submission in submissions if submission['userId'] == userId]
+        return self._page(submissions, 'studentSubmissions', pageToken, pageSize)
+
+    # Sheets
+    def _sheet(self, spreadsheet_id, sheet_name):
+        spreadsheet = self.fixtures.spreadsheets.get(spreadsheet_id)
+        if spreadsheet is None:
+            raise HttpError(404, f'Requested entity was not found: spreadsheet {spreadsheet_id}')
+        if sheet_name not in spreadsheet:
+            raise HttpError(400, f'Unable to parse range: {sheet_name}')
+        return spreadsheet[sheet_name]
+
+    def spreadsheets_get(self, spreadsheetId, **params):
+        spreadsheet = self.fixtures.spreadsheets.get(spreadsheetId)
+        if spreadsheet is None:
+            raise HttpError(404, f'Requested entity was not found: spreadsheet {spreadsheetId}')
+        return {
+            'spreadsheetId': spreadsheetId,
+            'sheets': [{'properties': {'title': title}} for title in spreadsheet],
+        }
+
+    def _read(self, spreadsheet_id, a1_range):
+        sheet_name, start_row, start_col, end_row, end_col = parse_range(a1_range)
+        rows = self._sheet(spreadsheet_id, sheet_name)
+        last_row = len(rows) - 1 if end_row is None else min(end_row, len(rows) - 1)
+        values = []
+        for row in rows[start_row:last_row + 1]:
+            cells = row[start_col:] if end_col is None else row[start_col:end_col + 1]
+            cells = [str(cell) for cell in cells]
+            # Sheets drops trailing empty cells and rows
+            while cells and cells[-1] == '':
+                cells.pop()
+            values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+        response = {'range': a1_range, 'majorDimension': 'ROWS'}
+        if values:
+            response['values'] = values
+        return response
+
+    def _write(self, spreadsheet_id, a1_range, values):
+        sheet_name, start_row, start_col, _, _ = parse_range(a1_range)
+        rows = self._sheet(spreadsheet_id, sheet_name)
+        for offset, new_cells in enumerate(values):
+            row_index = start_row + offset
+            while len(rows) <= row_index:
+                rows.append([])
+            row = rows[row_index]
+            while len(row) < start_col + len(new_cells):
+                row.append('')
+            row[start_col:start_col + len(new_cells)] = list(new_cells)
+        return sum(len(cells) for cells in values)
+
+    def values_get(self, spreadsheetId, range, **params):
+        return self._read(spreadsheetId, range)
+
+    def values_batch_get(self, spreadsheetId, ranges, **params):
+        if isinstance(ranges, str):
+            ranges = [ranges]
+        return {
+            'spreadsheetId': spreadsheetId,
+            'valueRanges': [self._read(spreadsheetId, a1_range) for a1_range in ranges],
+        }
+
+    def values_update(self, spreadsheetId, range, body, valueInputOption=None, **params):
+        cells = self._write(spreadsheetId, range, body.get('values', []))
+        return {'spreadsheetId': spreadsheetId, 'updatedRange': range, 'updatedCells': cells}
+
+    def values_append(self, spreadsheetId, range, body, valueInputOption=None, insertDataOption=None, **params):
+        sheet_name = parse_range(range)[0]
+        rows = self._sheet(spreadsheetId, sheet_name)
+        while rows and not any(str(cell) for cell in rows[-1]):
+            rows.pop()
+        for new_row in body.get('values', []):
+            rows.append(list(new_row))
+        return {'spreadsheetId': spreadsheetId, 'updates': {'updatedRows': len(body.get('values', []))}}
+
+    def values_batch_update(self, spreadsheetId, body, **params):
+        cells = sum(
+            self._write(spreadsheetId, value_range['range'], value_range['values'])
+            for value_range in body.get('data', [])
+        )
+        return {'spreadsheetId': spreadsheetId, 'totalUpdatedCells': cells}